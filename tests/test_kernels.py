@@ -0,0 +1,107 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+import xplt
+from xplt import _kernels
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def kernels(request, monkeypatch):
+    """The kernels module, using either the numpy or the jit compiled implementation"""
+    if request.param == "numba":
+        pytest.importorskip("numba")
+        monkeypatch.setattr(_kernels, "_jit_kernels", None)  # import on first use
+    else:
+        monkeypatch.setattr(_kernels, "_jit_kernels", False)  # as if numba is not available
+    return _kernels
+
+
+def distribution(n, seed=0, scale=1):
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=scale, size=n), rng.normal(scale=2 * scale, size=n)
+
+
+def grid_params(hexbin, gridsize):
+    """Grid parameters of a hexbin collection as used by PhaseSpacePlot"""
+    nx, ny = gridsize if np.iterable(gridsize) else (gridsize, int(gridsize / np.sqrt(3)))
+    offsets = hexbin.get_offsets()
+    (xmin, ymin), (xmax, ymax) = offsets[0], offsets[(nx + 1) * (ny + 1) - 1]
+    return xmin, ymin, (xmax - xmin) / nx, (ymax - ymin) / ny, nx, ny
+
+
+@pytest.mark.parametrize("gridsize", [100, 17, (30, 20), (12, 40)])
+def test_hexbin_counts(kernels, gridsize):
+    x, y = distribution(10000)
+    fig, ax = plt.subplots()
+    hexbin = ax.hexbin(x, y, gridsize=gridsize)
+    counts = kernels.hexbin_counts(x, y, *grid_params(hexbin, gridsize))
+    np.testing.assert_array_equal(counts, hexbin.get_array())
+    plt.close(fig)
+
+
+@pytest.mark.parametrize("gridsize", [100, (30, 20)])
+def test_hexbin_counts_on_existing_grid(kernels, gridsize):
+    x0, y0 = distribution(10000)
+    x, y = distribution(5000, seed=1, scale=0.5)
+    extent = np.min(x0), np.max(x0), np.min(y0), np.max(y0)
+    inside = (extent[0] <= x) & (x <= extent[1]) & (extent[2] <= y) & (y <= extent[3])
+    x, y = x[inside], y[inside]
+    fig, ax = plt.subplots()
+    params = grid_params(ax.hexbin(x0, y0, gridsize=gridsize), gridsize)
+    expected = ax.hexbin(x, y, gridsize=gridsize, extent=extent).get_array()
+    np.testing.assert_array_equal(kernels.hexbin_counts(x, y, *params), expected)
+    plt.close(fig)
+
+
+@pytest.mark.parametrize("gridsize", [100, (30, 20)])
+def test_phasespace_hist_update(kernels, gridsize):
+    particles = lambda x, px: dict(x=x, px=px)
+    x0, px0 = distribution(10000)
+    plot = xplt.PhaseSpacePlot(
+        particles(x0, px0), kind="x", plot="hist", hist_kwargs=dict(gridsize=gridsize)
+    )
+    hexbin = plot.artists_hexbin[0][0]
+
+    # update with data inside the grid
+    x, px = 0.5 * x0[::-1], 0.5 * px0[::-1]
+    plot.update(particles(x, px), autoscale=False)
+    assert plot.artists_hexbin[0][0] is hexbin  # grid re-used
+
+    # compare with hexbin on same grid
+    fx, fp = plot.factor_for("x"), plot.factor_for("px")
+    extent = fx * np.min(x0), fx * np.max(x0), fp * np.min(px0), fp * np.max(px0)
+    fig, ax = plt.subplots()
+    expected = ax.hexbin(fx * x, fp * px, gridsize=gridsize, extent=extent, mincnt=1)
+    np.testing.assert_array_equal(hexbin.get_array(), expected.get_array())
+    np.testing.assert_allclose(hexbin.get_offsets(), expected.get_offsets())
+    plt.close(fig)
+    plt.close(plot.fig)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_hexbin_counts_jit_equals_numpy(monkeypatch, dtype):
+    pytest.importorskip("numba")
+    x, y = distribution(100000)
+    x, y = x.astype(dtype), y.astype(dtype)
+    params = (-2.5, -3.7, 0.05, 0.13, 100, 57)  # grid covering only part of the data
+    monkeypatch.setattr(_kernels, "_jit_kernels", None)
+    jit = _kernels.hexbin_counts(x, y, *params)
+    assert _kernels._jit_kernels  # jit compiled version used
+    monkeypatch.setattr(_kernels, "_jit_kernels", False)
+    np.testing.assert_array_equal(jit, _kernels.hexbin_counts(x, y, *params))
+
+
+def test_hexbin_counts_multi(kernels):
+    xy = [distribution(n, seed=n) for n in (1000, 0, 20000, 1)]
+    xy[2] = xy[2][0].astype(np.float32), xy[2][1].astype(np.float32)
+    params = [(-3, -6, 0.06, 0.2, 100, 57), (0, 0, 1, 1, 3, 2), (-2, -4, 0.04, 0.1, 80, 80)]
+    params.append((-1, -1, 0.5, 0.5, 4, 4))
+    counts = kernels.hexbin_counts_multi(xy, params)
+    assert len(counts) == len(xy)
+    for (x, y), p, c in zip(xy, params, counts):
+        np.testing.assert_array_equal(c, kernels.hexbin_counts(x, y, *p))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Numeric kernels for computation intensive parts of plot updates
+
+Where beneficial, kernels are just-in-time compiled with numba (if available),
+otherwise the numpy implementation is used. The jit compiled versions are
+in :mod:`._kernels_jit`, which is only imported on first use.
+
+"""
+
+__author__ = "Philipp Niedermayer"
+__contact__ = "eltos@outlook.de"
+__date__ = "2026-10-14"
+
+import types
+
+import numpy as np
+
+# jit compiled kernels, imported on first use since importing numba is slow
+_jit_kernels = None
+
+
+def _jit():
+    """Return the module with jit compiled kernels, or None if numba is not available"""
+    global _jit_kernels
+    if _jit_kernels is None:
+        try:
+            from . import _kernels_jit as _jit_kernels
+        except ImportError:
+            # numba is an optional dependency
+            _jit_kernels = False
+    return _jit_kernels or None
+
+
+def accumulate_knl(lo, hi, knl, out):
+    """Accumulate knl values of elements onto s-bins
+
+    Args:
+        lo (np.ndarray): Index of first s-bin for each element range.
+        hi (np.ndarray): Index after last s-bin for each element range (hi >= lo).
+        knl (np.ndarray): Values of shape (orders, ranges) to add to the s-bins of each range.
+        out (np.ndarray): Output array of shape (orders, s-bins), values are overwritten.
+    """
+    # sweep line over a difference array
+    D = np.zeros((out.shape[0], out.shape[1] + 1))
+    for i in range(out.shape[0]):
+        np.add.at(D[i], lo, knl[i])
+        np.add.at(D[i], hi, -knl[i])
+    np.cumsum(D[:, :-1], axis=1, out=out)
+
+
+def hexbin_counts(x, y, xmin, ymin, sx, sy, nx, ny):
+    """Count points in hexagonal bins
+
+    The hexagon grid and the order of bins is the same as for :meth:`matplotlib.axes.Axes.hexbin`,
+    i.e. a lattice of (nx+1)*(ny+1) hexagons centered at (xmin + ix*sx, ymin + iy*sy) followed by
+    a lattice of nx*ny hexagons centered at (xmin + (ix+1/2)*sx, ymin + (iy+1/2)*sy).
+    Points outside the grid are ignored.
+
+    Args:
+        x (np.ndarray): X coordinates of points.
+        y (np.ndarray): Y coordinates of points.
+        xmin (float): X coordinate of grid origin.
+        ymin (float): Y coordinate of grid origin.
+        sx (float): Horizontal grid spacing.
+        sy (float): Vertical grid spacing.
+        nx (int): Number of hexagons in horizontal direction.
+        ny (int): Number of hexagons in vertical direction.
+
+    Returns:
+        np.ndarray: Counts of size (nx+1)*(ny+1) + nx*ny
+    """
+    jit = _jit()
+    if jit is not None:
+        return jit.hexbin_counts(x, y, xmin, ymin, sx, sy, nx, ny)
+
+    # positions in hexagon index coordinates (in double precision, same as jit compiled version)
+    ix = np.subtract(x, xmin, dtype=float) / sx
+    iy = np.subtract(y, ymin, dtype=float) / sy
+    ix1, iy1 = np.round(ix).astype(int), np.round(iy).astype(int)
+    ix2, iy2 = np.floor(ix).astype(int), np.floor(iy).astype(int)
+    # flat indices, plus one so that out-of-range points go to position 0
+    i1 = np.where(
+        (0 <= ix1) & (ix1 < nx + 1) & (0 <= iy1) & (iy1 < ny + 1), ix1 * (ny + 1) + iy1 + 1, 0
+    )
+    i2 = np.where((0 <= ix2) & (ix2 < nx) & (0 <= iy2) & (iy2 < ny), ix2 * ny + iy2 + 1, 0)
+    # assign to closest hexagon of either lattice
+    d1 = (ix - ix1) ** 2 + 3.0 * (iy - iy1) ** 2
+    d2 = (ix - ix2 - 0.5) ** 2 + 3.0 * (iy - iy2 - 0.5) ** 2
+    bdist = d1 < d2
+    counts1 = np.bincount(i1[bdist], minlength=1 + (nx + 1) * (ny + 1))[1:]
+    counts2 = np.bincount(i2[~bdist], minlength=1 + nx * ny)[1:]
+    return np.concatenate([counts1, counts2])
+
+
+def hexbin_counts_multi(xy, params):
+    """Count points in hexagonal bins for multiple data sets at once
+
+    Args:
+        xy (list[tuple[np.ndarray, np.ndarray]]): X and Y coordinates of points for each data set.
+        params (list[tuple]): Grid parameters (xmin, ymin, sx, sy, nx, ny) for each data set,
+            see :func:`hexbin_counts`.
+
+    Returns:
+        list[np.ndarray]: Counts for each data set, see :func:`hexbin_counts`
+    """
+    jit = _jit()
+    if jit is None or len(xy) < 2:
+        return [hexbin_counts(x, y, *p) for (x, y), p in zip(xy, params)]
+
+    # concatenate data sets so they can be binned in parallel by the jit compiled kernel
+    x = np.concatenate([x for x, _ in xy])
+    y = np.concatenate([y for _, y in xy])
+    start = np.cumsum([0] + [len(x) for x, _ in xy])
+    grid = np.array([p[:4] for p in params], dtype=float)
+    shape = np.array([p[4:] for p in params], dtype=np.int64)
+    offset = np.cumsum([0] + [(nx + 1) * (ny + 1) + nx * ny for nx, ny in shape])
+    counts = np.empty(offset[-1], dtype=np.int64)
+    jit.hexbin_counts_multi(x, y, start, grid, shape, counts, offset)
+    return np.split(counts, offset[1:-1])
+
+
+## Restrict star imports to local namespace
+__all__ = [
+    name
+    for name, thing in globals().items()
+    if not (name.startswith("_") or isinstance(thing, types.ModuleType))
+]
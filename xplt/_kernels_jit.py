@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Jit compiled versions of numeric kernels
+
+Use the functions in :mod:`._kernels` instead, which fall back to numpy if numba is not available.
+
+"""
+
+__author__ = "Philipp Niedermayer"
+__contact__ = "eltos@outlook.de"
+__date__ = "2026-10-14"
+
+import types
+
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def hexbin_counts(x, y, xmin, ymin, sx, sy, nx, ny):
+    """Count points in hexagonal bins, see :func:`._kernels.hexbin_counts`"""
+    counts = np.zeros((nx + 1) * (ny + 1) + nx * ny, dtype=np.int64)
+    for k in range(x.size):
+        # positions in hexagon index coordinates
+        ix = (x[k] - xmin) / sx
+        iy = (y[k] - ymin) / sy
+        ix1, iy1 = np.rint(ix), np.rint(iy)
+        ix2, iy2 = np.floor(ix), np.floor(iy)
+        # assign to closest hexagon of either lattice (if in range)
+        d1 = (ix - ix1) ** 2 + 3.0 * (iy - iy1) ** 2
+        d2 = (ix - ix2 - 0.5) ** 2 + 3.0 * (iy - iy2 - 0.5) ** 2
+        if d1 < d2:
+            if 0 <= ix1 < nx + 1 and 0 <= iy1 < ny + 1:
+                counts[int(ix1) * (ny + 1) + int(iy1)] += 1
+        elif 0 <= ix2 < nx and 0 <= iy2 < ny:
+            counts[(nx + 1) * (ny + 1) + int(ix2) * ny + int(iy2)] += 1
+    return counts
+
+
+@numba.njit(parallel=True, cache=True)
+def hexbin_counts_multi(x, y, start, grid, shape, counts, offset):
+    """Count points in hexagonal bins for concatenated data sets (in parallel)
+
+    Data set k is given by x[start[k]:start[k+1]] and y[start[k]:start[k+1]]
+    with grid parameters (*grid[k], *shape[k]), see :func:`hexbin_counts`,
+    and its counts are written to counts[offset[k]:offset[k+1]].
+    """
+    for k in numba.prange(start.size - 1):
+        counts[offset[k] : offset[k + 1]] = hexbin_counts(
+            x[start[k] : start[k + 1]],
+            y[start[k] : start[k + 1]],
+            grid[k, 0],
+            grid[k, 1],
+            grid[k, 2],
+            grid[k, 3],
+            shape[k, 0],
+            shape[k, 1],
+        )
+
+
+## Restrict star imports to local namespace
+__all__ = [
+    name
+    for name, thing in globals().items()
+    if not (name.startswith("_") or isinstance(thing, types.ModuleType))
+]
@@ -202,6 +202,7 @@ class XPlot:
         if ax is None:
             fig, ax = plt.subplots(**subplots_kwargs)
         self.ax = ax
+        self._axflat = flattened(ax)
         self.fig = self.axflat[0].figure
         self.axflat_twin = []
 
@@ -301,7 +302,7 @@ class XPlot:
     @property
     def axflat(self):
         """Return a flat list of all primary axes"""
-        return flattened(self.ax)
+        return self._axflat
 
     def axis(self, subplot=0, twin=0):
         """Return the axis for a given flat subplot index and twin index
@@ -15,6 +15,7 @@ import types
 import matplotlib as mpl
 import numpy as np
 
+from ._kernels import accumulate_knl
 from .base import XPlot, XManifoldPlot
 from .util import defaults, get, defaults_for
 from .properties import Property, DataProperty
@@ -53,7 +54,15 @@ class KnlPlot(XManifoldPlot):
     """A plot for knl values along line"""
 
     def __init__(
-        self, line=None, *, knl=None, filled=True, resolution=1000, line_length=None, **kwargs
+        self,
+        line=None,
+        *,
+        knl=None,
+        filled=True,
+        resolution=1000,
+        line_length=None,
+        dtype=None,
+        **kwargs,
     ):
         """
 
@@ -66,6 +75,8 @@ class KnlPlot(XManifoldPlot):
             filled (bool): If True, make a filled plot instead of a line plot.
             resolution (int): Number of points to use for plot.
             line_length (float, optional): Length of line (only required if line is None).
+            dtype (np.dtype | None): Data type for computed knl values, e.g. ``np.float32`` to reduce memory usage
+                at the expense of precision. Defaults to float64.
             kwargs: See :class:`~.base.XPlot` for additional arguments
 
         Known issues:
@@ -86,14 +97,21 @@ class KnlPlot(XManifoldPlot):
             raise ValueError("Either line or line_length parameter must not be None")
         self.S = np.linspace(0, line_length or line.get_length(), resolution)
         self.filled = filled
+        self.dtype = float if dtype is None else dtype
+        self._geom_cache = {}
 
         super().__init__(on_x="s", on_y=knl, **kwargs)
 
         # create plot elements
+        self._verts = {}
+
         def create_artists(i, j, k, a, p):
             kwargs = dict(color=f"C{order(p)}", alpha=0.5, label=self.label_for(p, unit=True))
             if self.filled:
-                return a.fill_between(self.S, np.zeros_like(self.S), zorder=3, lw=0, **kwargs)
+                art = a.fill_between(self.S, np.zeros_like(self.S), zorder=3, lw=0, **kwargs)
+                # the upper envelope of the polygon is updated in place (values at 1..N)
+                self._verts[i, j, k] = art.get_paths()[0].vertices
+                return art
             else:
                 return a.plot([], [], **kwargs)[0]
 
@@ -118,20 +136,24 @@ class KnlPlot(XManifoldPlot):
         Returns:
             changed artists
         """
-        # compute knl as function of s
-        values = {p: np.zeros(self.S.size) for p in self.on_y_unique}
+        # knl values of elements
         orders = {p: order(p) for p in self.on_y_unique}
-        Smax = line.get_length()
-        for name, el, s0, s1 in iter_elements(line):
-            if 0 <= s0 <= Smax:
-                mask = (self.S >= s0) & (self.S < s1)
-            else:  # handle wrap around
-                mask = (self.S >= s0 % Smax) | (self.S < s1 % Smax)
-            for knl, n in orders.items():
-                if hasattr(el, f"k{n}") and hasattr(el, "length"):
-                    values[knl][mask] += getattr(el, f"k{n}") * el.length
-                elif hasattr(el, "knl") and n <= el.order:
-                    values[knl][mask] += el.knl[n]
+        elements, sources, K, index, lo, hi = self._element_geometry(line, orders.values())
+        for e, (el, (k_orders, knl_orders)) in enumerate(zip(elements, sources)):
+            if k_orders:
+                length = el.length
+                for i, n in k_orders:
+                    K[i, e] = getattr(el, f"k{n}") * length
+            if knl_orders:
+                knl = el.knl
+                for i, n in knl_orders:
+                    K[i, e] = knl[n]
+        K = np.take(K, index, axis=1)
+
+        # compute knl as function of s
+        KNL = np.empty((len(orders), self.S.size), dtype=self.dtype)
+        accumulate_knl(lo, hi, K, KNL)
+        values = dict(zip(orders, KNL))
 
         # plot
         s = self.S * self.factor_for("s")
@@ -140,11 +162,12 @@ class KnlPlot(XManifoldPlot):
             for j, pp in enumerate(ppp):
                 for k, p in enumerate(pp):
                     art = self.artists[i][j][k]
-                    y = self.factor_for(p) * values[p]
                     if self.filled:
-                        art.get_paths()[0].vertices[1 : 1 + y.size, 1] = y
+                        verts = self._verts[i, j, k]
+                        np.multiply(values[p], self.factor_for(p), out=verts[1 : 1 + s.size, 1])
+                        art.stale = True
                     else:
-                        art.set_data((s, y))
+                        art.set_data((s, self.factor_for(p) * values[p]))
                     changed.append(art)
 
                 if autoscale:
@@ -162,6 +185,53 @@ class KnlPlot(XManifoldPlot):
 
         return changed
 
+    def _element_geometry(self, line, orders):
+        """Return element geometry of line mapped to the s-bins of this plot
+
+        The result is cached and only recomputed if a different line is passed or the number
+        of elements in the line changes.
+
+        Args:
+            line (xtrack.Line): Line of elements.
+            orders (iterable[int]): Orders n of knl values to consider.
+
+        Returns:
+            (elements, sources, K, index, lo, hi): List of elements with knl values, for each element
+                the (index, order) pairs to read from ``k{n}*length`` and from ``knl[n]`` respectively,
+                a buffer of shape (orders, elements) for the values, and for each range [lo, hi)
+                of s-bins the index of the respective element.
+        """
+        key = (id(line), len(line.element_names))
+        if key not in self._geom_cache:
+            Smax = line.get_length()
+            elements, sources, ranges = [], [], []
+            for name, el, s0, s1 in iter_elements(line):
+                # determine once where to read the knl values from (attribute access is slow)
+                k_orders, knl_orders = [], []
+                has_length, has_knl = hasattr(el, "length"), hasattr(el, "knl")
+                max_order = el.order if has_knl else -1
+                for i, n in enumerate(orders):
+                    if has_length and hasattr(el, f"k{n}"):
+                        k_orders.append((i, n))
+                    elif n <= max_order:
+                        knl_orders.append((i, n))
+                if not has_knl and not k_orders:
+                    continue
+                if 0 <= s0 <= Smax:
+                    ranges.append((len(elements), s0, s1))
+                else:  # handle wrap around by splitting into [s0, end) and [start, s1)
+                    ranges.append((len(elements), s0 % Smax, np.inf))
+                    ranges.append((len(elements), -np.inf, s1 % Smax))
+                elements.append(el)
+                sources.append((k_orders, knl_orders))
+            K = np.zeros((len(orders), len(elements)))
+            index, S0, S1 = np.reshape(ranges, (-1, 3)).T
+            lo = np.searchsorted(self.S, S0, side="left")
+            hi = np.maximum(lo, np.searchsorted(self.S, S1, side="left"))
+            # keep a reference to the line so its id is not reused
+            self._geom_cache = {key: (line, elements, sources, K, index.astype(int), lo, hi)}
+        return self._geom_cache[key][1:]
+
     def prop(self, p):
         if match := re.fullmatch(r"k(\d+)l", p):
             n = match.group(1)
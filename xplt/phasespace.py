@@ -9,6 +9,7 @@ __author__ = "Philipp Niedermayer"
 __contact__ = "eltos@outlook.de"
 __date__ = "2022-09-06"
 
+import hashlib
 import types
 
 import matplotlib as mpl
@@ -16,12 +17,11 @@ import numpy as np
 from matplotlib.patches import Ellipse
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
+from ._kernels import hexbin_counts_multi
 from .base import XPlot, XManifoldPlot, AngleLocator, RadiansFormatter
 from .particles import ParticlePlotMixin
 from .util import get, defaults, normalized_coordinates, denormalized_coordinates, defaults_for
 
-pairwise = np.c_
-
 
 class PhaseSpacePlot(XPlot, ParticlePlotMixin):
     """A plot for phase space distributions"""
@@ -32,6 +32,7 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
         kind=None,
         plot="auto",
         *,
+        auto_threshold=50000,
         scatter_kwargs=None,
         hist_kwargs=None,
         mask=None,
@@ -52,6 +53,7 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
         titles="auto",
         animated=False,
         twiss=None,
+        dtype=None,
         **kwargs,
     ):
         """
@@ -65,7 +67,10 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
                      In addition, abbreviations for x-y-parameter pairs are supported (e.g. 'x' for 'x-px').
                      For normalized coordinates, use uppercase letters (e.g. 'X' for 'X-Px').
             plot (str): Defines the type of plot. Can be 'auto', 'scatter' or 'hist'. Default is 'auto' for which the plot type is chosen automatically based on the number of particles.
+            auto_threshold (int): Maximum number of particles for which a scatter plot is used if plot is 'auto'. For more particles, a 2D histogram is used.
             scatter_kwargs (dict): Additional kwargs for scatter plot, see :meth:`matplotlib.axes.Axes.scatter`.
+                           Like the histogram, the scatter plot is rasterized by default (while axes and labels remain vector graphics),
+                           pass ``rasterized=False`` to disable.
             hist_kwargs (dist): Additional kwargs for 2D histogram plot, see :meth:`matplotlib.axes.Axes.hexbin`.
             mask (Any): An index mask to select particles to plot. If None, all particles are plotted.
             masks (list[mask]): List of masks for each subplot.
@@ -86,6 +91,8 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
             titles (list[str]): List of titles for each subplot or 'auto' to automatically set titles based on plot kind.
             animated (bool): If True, improve plotting performance for creating an animation.
             twiss (dict | None): Twiss parameters (alfx, alfy, betx and bety) to use for conversion to normalized phase space coordinates.
+            dtype (np.dtype | None): Data type to convert coordinates to before plotting, e.g. ``np.float32`` to reduce memory usage and
+                  speed up updates of large distributions at the expense of precision. If None, the data type of the data is kept.
             kwargs: See :class:`~.particles.ParticlePlotMixin` and :class:`~.base.XPlot` for additional arguments
 
 
@@ -145,9 +152,11 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
             color = n * [None]
 
         self.plot = plot
+        self.auto_threshold = auto_threshold
         self.color = color
         self.percentiles = percentiles
         self.projections = projections
+        self.dtype = dtype
 
         # Create plot axes
 
@@ -170,12 +179,24 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
         if len(self.axflat) < n:
             raise ValueError(f"Need {n} axes but got only {len(self.axflat)}")
 
+        # properties and factors to convert them into display units (looked up only once)
+        self._props, self._factors = {}, {}
+        for p in [*(p for ab in self.kind for p in ab), *self.color]:
+            if p is not None and p not in self._props:
+                self._props[p] = self.prop(p)
+                self._factors[p] = self.factor_for(p)
+        self._buffers = {}
+
         # Create distribution plots
         self.artists_scatter = [None] * n
+        self._scatter_offsets = [np.empty((0, 2)) for _ in range(n)]
         self.artists_hexbin = [()] * n
+        self._hexbin_grid = [None] * n
+        self._autoscaled = [False] * n
         self.artists_mean = [None] * n
         self.artists_std = [None] * n
         self.artists_percentiles = [()] * n
+        self._stats_cache = [None] * n
         self.ax_twin = [{} for _ in range(n)]
         self.artists_twin = [{} for _ in range(n)]
         self.artists_hamiltonian = [{} for _ in range(n)]
@@ -189,7 +210,13 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
 
             # scatter plot
             kwargs = defaults_for(
-                "scatter", scatter_kwargs, s=4, cmap=cmap, lw=0, animated=animated
+                "scatter",
+                scatter_kwargs,
+                s=4,
+                cmap=cmap,
+                lw=0,
+                rasterized=True,
+                animated=animated,
             )
             scatter_cmap = kwargs.pop("cmap")  # bypass UserWarning: ignored
             vmin, vmax = kwargs.pop("vmin", None), kwargs.pop("vmax", None)
@@ -303,11 +330,21 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
             particles (Any): A dictionary with particle information
             mask (Any): An index mask to select particles to plot. If None, all particles are plotted.
             masks (list): List of masks for each subplot.
-            autoscale (bool): Whether or not to perform autoscaling on all axes.
+            autoscale (bool | str): Whether or not to perform autoscaling on all axes.
+                Use ``"once"`` to only autoscale axes which have not been autoscaled before
+                (e.g. for animations), ``"always"`` is the same as True.
 
         Returns:
             List of changed artists.
         """
+        if isinstance(autoscale, str) and autoscale not in ("once", "always"):
+            raise ValueError(
+                f"autoscale must be a boolean, 'once' or 'always', but got {autoscale!r}"
+            )
+        once = autoscale == "once"
+        autoscale = [
+            not self._autoscaled[i] if once else bool(autoscale) for i in range(len(self.kind))
+        ]
         if masks is None:
             masks = [mask] * len(self.kind)
         elif mask is not None:
@@ -317,32 +354,93 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
 
         changed_artists = []
 
-        for i, ((a, b), c, ax) in enumerate(zip(self.kind, self.color, self.axflat)):
-            # coordinates
-            x = self.prop(a).values(particles, masks[i], unit=self.display_unit_for(a))
-            y = self.prop(b).values(particles, masks[i], unit=self.display_unit_for(b))
-
-            # statistics
-            XY = np.array((x, y))
+        # coordinates (each property is only evaluated once per mask)
+        cache = {}
+
+        def values(p, m, i):
+            if (p, id(m)) not in cache:
+                v = self._props[p].values(particles, m)
+                if self._factors[p] != 1 or (self.dtype is not None and v.dtype != self.dtype):
+                    # scale (and convert) into a buffer which is re-used for subsequent updates
+                    buffer = self._buffers.get((p, i))
+                    if buffer is None or buffer.size < v.size:
+                        dtype = float if self.dtype is None else self.dtype
+                        buffer = self._buffers[p, i] = np.empty(v.size, dtype=dtype)
+                    v = np.multiply(v, self._factors[p], out=buffer[: v.size])
+                cache[p, id(m)] = v
+            return cache[p, id(m)]
+
+        coords = [
+            (values(a, m, i), values(b, m, i))
+            for i, ((a, b), m) in enumerate(zip(self.kind, masks))
+        ]
+
+        # statistics (only where required and changed, batched for all subplots if possible)
+        needed = [
+            i
+            for i in range(len(self.kind))
+            if self.artists_mean[i] or self.artists_std[i] or self.artists_percentiles[i]
+        ]
+        fingerprints = {i: self._fingerprint(*coords[i]) for i in needed}
+        stale = [
+            i
+            for i in needed
+            if self._stats_cache[i] is None or self._stats_cache[i][0] != fingerprints[i]
+        ]
+        if len(set(len(coords[i][0]) for i in stale)) == 1:
+            batch = zip(*self._statistics(np.array([coords[i] for i in stale])))
+        else:
+            batch = (self._statistics(np.array(coords[i])) for i in stale)
+        for i, (XY0, UV, evals, evecs) in zip(stale, batch):
+            es = None
+            if self.artists_percentiles[i] and UV.shape[-1] > 1:
+                # normalize distribution using eigenvalues and -vectors
+                NN = np.dot(evecs.T, UV) / np.sqrt(evals)[:, np.newaxis]
+                # percentiles in normalized distribution
+                es = np.percentile(np.einsum("ij,ij->j", NN, NN), self.percentiles[i]) ** 0.5
+            # only keep results which do not scale with the number of particles
+            self._stats_cache[i] = fingerprints[i], (XY0, evals, evecs, es)
+        stats = {i: self._stats_cache[i][1] for i in needed}
+
+        # plot types
+        plots = [self.plot] * len(self.kind)
+        for i, (x, y) in enumerate(coords):
+            if plots[i] == "auto":
+                plots[i] = "scatter" if len(x) <= self.auto_threshold else "hist"
+
+        # histogram counts on existing hexagon grids (batched for all subplots)
+        binned = [
+            i
+            for i in range(len(self.kind))
+            if plots[i] == "hist" and self._hexbin_grid_fits(i, *coords[i], regrid=autoscale[i])
+        ]
+        binned_counts = hexbin_counts_multi(
+            [coords[i] for i in binned], [self._hexbin_grid[i]["params"] for i in binned]
+        )
+        binned_counts = dict(zip(binned, binned_counts))
 
-            XY0 = np.mean(XY, axis=1)
-            UV = XY - XY0[:, np.newaxis]  # centered coordinates
+        for i, ((a, b), c, ax) in enumerate(zip(self.kind, self.color, self.axflat)):
+            x, y = coords[i]
+            XY0, evals, evecs, es = stats.get(i, [None] * 4)
 
             # 2D phase space distribution
             ##############################
 
-            plot = self.plot
-            if plot == "auto":
-                plot = "scatter" if len(x) <= 1000 else "hist"
+            plot = plots[i]
 
             # scatter plot
             scatter = self.artists_scatter[i]
             if plot == "scatter":
                 scatter.set_visible(True)
-                scatter.set_offsets(pairwise[x, y])
+                # re-use buffer for offsets (grown if required)
+                if len(self._scatter_offsets[i]) < len(x):
+                    self._scatter_offsets[i] = np.empty((len(x), 2))
+                offsets = self._scatter_offsets[i][: len(x)]
+                offsets[:, 0], offsets[:, 1] = x, y
+                scatter.set_offsets(offsets)
                 if c is not None:
-                    v = self.prop(c).values(particles, masks[i], unit=self.display_unit_for(c))
-                    if autoscale:
+                    v = values(c, masks[i], i)
+                    if autoscale[i]:
                         # scatter.set_clim(np.min(v), np.max(v)) # sometimes leaves behind black dots (bug?)
                         # scatter.norm = mpl.colors.Normalize(np.min(v), np.max(v)) # works, but resets colorbar locator/formatter
                         # scatter.norm.autoscale(v) # also sometimes leaves behind black dots (bug?)
@@ -369,17 +467,17 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
                 changed_artists.append(scatter)
 
             # hexbin plot
-            # remove old hexbin and create a new one (no update method exists)
-            for artist in self.artists_hexbin[i]:
-                changed_artists.append(artist)
-                artist.remove()
-            self.artists_hexbin[i] = []
             if plot == "hist":
-                # twice to mitigate https://stackoverflow.com/q/17354095
-                hexbin_bg = ax.hexbin(x, y, edgecolors="face", lw=0.1, **self._hxkw)
-                hexbin_fg = ax.hexbin(x, y, edgecolors="none", lw=0.0, **self._hxkw)
-                self.artists_hexbin[i] = [hexbin_bg, hexbin_fg]
-                changed_artists.extend(self.artists_hexbin[i])
+                changed_artists.extend(
+                    self._update_hexbin(
+                        i, x, y, binned_counts.get(i), autoscale_norm=autoscale[i] or not once
+                    )
+                )
+            else:
+                for artist in self.artists_hexbin[i]:
+                    if artist.get_visible():
+                        artist.set_visible(False)
+                        changed_artists.append(artist)
 
             # 2D mean indicator (cross)
             if self.artists_mean[i]:
@@ -387,36 +485,33 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
                 changed_artists.append(self.artists_mean[i])
 
             # 2D size indicator (ellipses)
-            if UV.shape[1] > 1 and (self.artists_std[i] or self.artists_percentiles[i]):
-                evals, evecs = np.linalg.eig(np.cov(UV))  # eigenvalues and -vectors
+            if (self.artists_std[i] or self.artists_percentiles[i]) and len(x) > 1:
+                angle = np.degrees(np.arctan2(evecs[1, 0], evecs[0, 0]))
 
                 # 2D std indicator
                 if self.artists_std[i]:
                     w, h = 2 * np.sqrt(evals)
-                    self.artists_std[i].set(
-                        center=XY0, width=w, height=h, angle=np.degrees(np.arctan2(*evecs[1]))
-                    )
+                    self.artists_std[i].set(center=XY0, width=w, height=h, angle=angle)
                     changed_artists.append(self.artists_std[i])
 
                 # 2D percentile indicator
                 if self.artists_percentiles[i]:
-                    # normalize distribution using eigenvalues and -vectors
-                    NN = np.dot(evecs.T, UV) / np.sqrt(evals)[:, np.newaxis]
-                    for j, p in enumerate(self.percentiles[i]):
-                        # percentile in normalized distribution
-                        e = np.percentile(np.sum(NN**2, axis=0), p) ** 0.5
+                    for j, e in enumerate(es):
                         w, h = 2 * e * np.sqrt(evals)
                         self.artists_percentiles[i][j].set(
-                            center=XY0, width=w, height=h, angle=np.degrees(np.arctan2(*evecs[1]))
+                            center=XY0, width=w, height=h, angle=angle
                         )
                         changed_artists.append(self.artists_percentiles[i][j])
 
             # Autoscale
-            if autoscale:
+            if autoscale[i]:
+                if len(x) > 0:
+                    self._autoscaled[i] = True
                 if plot == "scatter":
                     self._autoscale(ax, [self.artists_scatter[i]])
-                elif plot == "hist":
-                    self._autoscale(ax, self.artists_hexbin[i])
+                elif plot == "hist" and len(x) > 0:
+                    # data extent directly, instead of scanning the hexbin collections
+                    self._autoscale(ax, data=[(x, y)])
 
             # 1D histogram projections
             ###########################
@@ -441,6 +536,147 @@ class PhaseSpacePlot(XPlot, ParticlePlotMixin):
 
         return changed_artists
 
+    @staticmethod
+    def _fingerprint(*arrays):
+        """Fingerprint of arrays (shape, dtype and hash of content) to detect changed data"""
+        return tuple(
+            (a.shape, a.dtype.str, hashlib.blake2b(np.ascontiguousarray(a)).digest())
+            for a in arrays
+        )
+
+    @staticmethod
+    def _statistics(XY):
+        """Compute statistics of a distribution
+
+        Args:
+            XY (np.ndarray): Coordinates of shape (..., 2, N) where leading dimensions are batched.
+
+        Returns:
+            (XY0, UV, evals, evecs): Mean of shape (..., 2), centered coordinates of
+                shape (..., 2, N), as well as eigenvalues (descending) of shape (..., 2) and
+                -vectors (columns) of shape (..., 2, 2) of the covariance matrix (NaN if N < 2).
+        """
+        XY0 = np.mean(XY, axis=-1)
+        UV = XY - XY0[..., np.newaxis]  # centered coordinates
+        evals = np.full(XY.shape[:-1], np.nan)
+        evecs = np.full(XY.shape[:-1] + (2,), np.nan)
+        if XY.shape[-1] > 1:
+            cov = UV @ np.swapaxes(UV, -1, -2) / (XY.shape[-1] - 1)
+            # closed form eigendecomposition of symmetric 2x2 matrix [[a, b], [b, c]]
+            a, b, c = cov[..., 0, 0], cov[..., 0, 1], cov[..., 1, 1]
+            m, d = (a + c) / 2, np.hypot((a - c) / 2, b)
+            evals = np.stack((m + d, np.maximum(m - d, 0)), axis=-1)
+            theta = np.arctan2(2 * b, a - c) / 2  # major axis angle
+            cos, sin = np.cos(theta), np.sin(theta)
+            evecs = np.stack(
+                (np.stack((cos, -sin), axis=-1), np.stack((sin, cos), axis=-1)), axis=-2
+            )
+        return XY0, UV, evals, evecs
+
+    def _hexbin_supported(self):
+        """Whether the hexbin kwargs allow to count bins with :func:`~._kernels.hexbin_counts`"""
+        unsupported = any(k in self._hxkw for k in ("C", "marginals", "xscale", "yscale"))
+        return not unsupported and self._hxkw.get("bins") in (None, "log")
+
+    def _hexbin_grid_fits(self, i, x, y, *, regrid=False):
+        """Whether the existing hexagon grid of a subplot can be used for the given data
+
+        Args:
+            i (int): Subplot index.
+            x (np.ndarray): X coordinates of points.
+            y (np.ndarray): Y coordinates of points.
+            regrid (bool): Whether a new hexagon grid is requested anyway.
+
+        Returns:
+            bool: False if a new grid needs to be created.
+        """
+        grid = self._hexbin_grid[i]
+        if grid is None or regrid or not self._hexbin_supported():
+            return False
+        if "extent" in self._hxkw or len(x) == 0:
+            return True
+        xmin, xmax, ymin, ymax = grid["extent"]
+        return (
+            xmin <= np.nanmin(x)
+            and np.nanmax(x) <= xmax
+            and ymin <= np.nanmin(y)
+            and np.nanmax(y) <= ymax
+        )
+
+    def _update_hexbin(self, i, x, y, counts=None, *, autoscale_norm=True):
+        """Update the hexbin histogram of a subplot
+
+        Matplotlib provides no method to update a hexbin plot. Instead of re-creating it on every
+        update, the hexagon grid is kept and only the visible bins and their counts are updated.
+
+        Args:
+            i (int): Subplot index.
+            x (np.ndarray): X coordinates of points.
+            y (np.ndarray): Y coordinates of points.
+            counts (np.ndarray | None): Counts of points in the bins of the existing hexagon grid,
+                see :func:`~._kernels.hexbin_counts`. If None, a new grid is fitted to the data.
+            autoscale_norm (bool): Whether to autoscale the color norm to the counts
+                (always done for a new grid, unless norm, vmin or vmax are specified).
+
+        Returns:
+            List of changed artists.
+        """
+        ax = self.axflat[i]
+        kwargs = dict(self._hxkw)
+        changed = []
+
+        if not self._hexbin_supported():
+            # not supported by hexbin_counts, re-create on every update
+            for artist in self.artists_hexbin[i]:
+                changed.append(artist)
+                artist.remove()
+            # edges in face color to mitigate https://stackoverflow.com/q/17354095
+            self.artists_hexbin[i] = [ax.hexbin(x, y, edgecolors="face", lw=0.1, **kwargs)]
+            changed.extend(self.artists_hexbin[i])
+            return changed
+
+        mincnt = kwargs.pop("mincnt", None)
+        new_grid = counts is None
+        if new_grid:
+            # remove old hexbin and create a new one
+            for artist in self.artists_hexbin[i]:
+                changed.append(artist)
+                artist.remove()
+            if len(x) == 0:
+                kwargs = defaults(kwargs, extent=(0, 1, 0, 1))
+            # create with mincnt=None to get the full grid of hexagons
+            # edges in face color to mitigate https://stackoverflow.com/q/17354095
+            hexbin = ax.hexbin(x, y, edgecolors="face", lw=0.1, **kwargs)
+            self.artists_hexbin[i] = [hexbin]
+            # grid parameters from the centers of the first and last hexagon of the first lattice
+            gridsize = kwargs.get("gridsize", 100)
+            nx, ny = gridsize if np.iterable(gridsize) else (gridsize, int(gridsize / np.sqrt(3)))
+            offsets = hexbin.get_offsets()
+            (xmin, ymin), (xmax, ymax) = offsets[0], offsets[(nx + 1) * (ny + 1) - 1]
+            self._hexbin_grid[i] = grid = dict(
+                extent=(xmin, xmax, ymin, ymax),
+                offsets=offsets,
+                params=(xmin, ymin, (xmax - xmin) / nx, (ymax - ymin) / ny, nx, ny),
+            )
+            counts = hexbin.get_array()
+        else:
+            grid = self._hexbin_grid[i]
+
+        # only show bins with sufficient counts
+        visible = np.ones(len(counts), dtype=bool) if mincnt is None else counts >= mincnt
+        autoscale_norm = (autoscale_norm or new_grid) and all(
+            kwargs.get(k) is None for k in ("norm", "vmin", "vmax")
+        )
+        for artist in self.artists_hexbin[i]:
+            artist.set_visible(True)
+            artist.set_offsets(grid["offsets"][visible])
+            artist.set_array(counts[visible])
+            if autoscale_norm and np.any(visible):
+                artist.norm.autoscale(counts[visible])
+            changed.append(artist)
+
+        return changed
+
     def title_for(self, a, b):
         """
         Plot title for a given pair (a,b) of properties
@@ -128,11 +128,11 @@ class DataProperty(Property):
             raise RuntimeError("Cannot get data from a property with key None")
         v = get(data, self.key)
 
-        # apply mask
-        v = np.array(v)
+        # apply mask (avoid copies, the data is copied at most once below)
+        v = np.asarray(v)
         if v.ndim > 0:
             if callable(mask):
-                v = v.flatten()
+                v = v.ravel()
                 mask = mask(
                     np.ones_like(v, dtype="bool"), lambda key: self.prop(key).values(data)
                 )
@@ -140,12 +140,13 @@ class DataProperty(Property):
                 v = v[mask]
 
         # flatten
-        v = v.flatten()
+        v = v.ravel()
 
         # convert to unit
         if unit is not None:
             factor = pint.Quantity(1, self.unit).to(unit).magnitude
-            v *= factor
+            if factor != 1:
+                v = v * factor  # not in-place, since v might be a view of data
 
         return v
 